@@ -9,18 +9,39 @@ simulating what py-juxlib would add during test execution.
 
 Usage:
     python enrich-fixtures.py <raw_dir> <enriched_dir> [--metadata-file <file>]
+                              [--jobs <n>] [--dry-run] [--quiet]
+
+Output that is newer than its input and carries a jux-meta marker for
+the same metadata is skipped.
 
 Example:
     python enrich-fixtures.py raw/ enriched/
     python enrich-fixtures.py raw/pytest/ enriched/pytest/ --metadata-file sample-metadata.json
+
+Prerequisites:
+    - lxml must be installed: pip install lxml
 """
 
 import argparse
+import hashlib
 import json
+import mmap
+import os
+import re
+import shutil
 import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
+from itertools import repeat
 from pathlib import Path
-from xml.etree import ElementTree as ET
+
+try:
+    from lxml import etree as ET
+except ImportError:
+    print("Error: lxml is required for enrichment")
+    print("Install with: pip install lxml")
+    sys.exit(1)
 
 # Default sample metadata for enrichment
 DEFAULT_METADATA = {
@@ -28,7 +49,7 @@ DEFAULT_METADATA = {
     "jux.username": "ci-user",
     "jux.platform": "Linux-6.1.0-x86_64",
     "jux.python_version": "3.12.1",
-    "jux.timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    "jux.timestamp": None,  # Set to the current time in main() unless overridden
     "jux.project_name": "sample-project",
     "jux.git_commit": "abc123def456789012345678901234567890abcd",
     "jux.git_branch": "main",
@@ -39,57 +60,301 @@ DEFAULT_METADATA = {
     "jux.ci_build_url": "https://github.com/example/sample-project/actions/runs/12345",
 }
 
+# Shared parser; keep blank text so the fixtures' indentation survives, and
+# never expand entities or touch the network
+_PARSER = ET.XMLParser(
+    remove_blank_text=False, huge_tree=True, resolve_entities=False, no_network=True
+)
+
+# Leading bytes searched for the root start tag when splicing
+_HEAD_SIZE = 64 * 1024
+_COPY_CHUNK_SIZE = 1024 * 1024
+_XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+
+# Per-file report lines are written in batches of this many
+_OUTPUT_BATCH_SIZE = 256
+
+# Prolog (BOM, declaration, comments, PIs) followed by the root start tag
+_ROOT_START_TAG = re.compile(
+    rb"\A(?P<bom>\xef\xbb\xbf)?(?P<decl><\?xml\s[^>]*\?>)?"
+    rb"(?:\s+|<!--.*?-->|<\?.*?\?>)*"
+    rb"(?P<tag><testsuites?(?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*\s*>)",
+    re.DOTALL,
+)
+
+# A default namespace on the root; lxml then reports it as an unknown root
+_DEFAULT_NAMESPACE = re.compile(rb"\sxmlns\s*=")
+
+# Comment written after the properties block, fingerprinting the metadata
+_METADATA_MARKER = re.compile(rb"<!-- jux-meta:(?P<hash>[0-9a-f]+) -->")
+
+# Start of a properties element, at any depth
+_PROPERTIES_TAG = b"<properties"
+
+# Root indentation, then comments up to the first child if it is <properties>
+_EXISTING_PROPERTIES = re.compile(
+    rb"(?P<indent>\s*)(?:<!--.*?-->\s*)*(?P<properties><properties[\s/>])?",
+    re.DOTALL,
+)
+
+
+def iter_xml(root: str) -> Iterator[str]:
+    """Yield the path of every *.xml file below root, skipping hidden directories.
+
+    A plain os.scandir() walk: unlike Path.rglob() it builds no Path
+    objects and reuses the directory entry's cached file type.
+    """
+    pending = [root]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        pending.append(entry.path)
+                elif entry.name.endswith(".xml") and entry.is_file():
+                    yield entry.path
+
+
+def serialize_properties(metadata: dict) -> bytes:
+    """Serialize metadata as a standalone <properties> block.
+
+    Built once per run. The result is ASCII (non-ASCII characters become
+    character references), so it can be spliced into any ASCII-compatible
+    document.
+    """
+    properties = ET.Element("properties")
+    for name, value in metadata.items():
+        ET.SubElement(properties, "property", name=name, value=str(value))
+    return ET.tostring(properties)
+
+
+def metadata_fingerprint(metadata: dict) -> str:
+    """Return a short, stable hash of the metadata applied by a run."""
+    canonical = json.dumps(metadata, sort_keys=True).encode()
+    return hashlib.sha256(canonical).hexdigest()[:16]
 
-def add_metadata_properties(root: ET.Element, metadata: dict) -> None:
-    """Add metadata as properties to the root element."""
-    # Find or create properties element
+
+def _marker_text(meta_hash: str) -> str:
+    """Text of the marker comment recording meta_hash in enriched output."""
+    return f" jux-meta:{meta_hash} "
+
+
+def is_up_to_date(input_path: str, output_path: Path, meta_hash: str) -> bool:
+    """Check whether output is newer than input and carries meta_hash."""
+    try:
+        if output_path.stat().st_mtime < os.stat(input_path).st_mtime:
+            return False
+        with open(output_path, "rb") as f:
+            marker = _METADATA_MARKER.search(f.read(_HEAD_SIZE))
+    except FileNotFoundError:
+        return False
+    return marker is not None and marker.group("hash").decode() == meta_hash
+
+
+def add_metadata_properties(
+    root: ET.Element, properties_xml: bytes, meta_hash: str
+) -> None:
+    """Add pre-serialized metadata properties and a marker to the root element."""
+    metadata_properties = ET.fromstring(properties_xml)
+
+    # Extend an existing properties element, or insert ours at the beginning
     properties = root.find("properties")
     if properties is None:
-        properties = ET.Element("properties")
-        # Insert at the beginning
+        properties = metadata_properties
         root.insert(0, properties)
+    else:
+        properties.extend(list(metadata_properties))
 
-    # Add metadata properties
-    for name, value in metadata.items():
-        prop = ET.SubElement(properties, "property")
-        prop.set("name", name)
-        prop.set("value", str(value))
+    # Update the marker left by an earlier run with different metadata,
+    # or add one right after the properties block
+    markers = [
+        comment
+        for comment in root.iterchildren(ET.Comment)
+        if _METADATA_MARKER.fullmatch(ET.tostring(comment, with_tail=False))
+    ]
+    if not markers:
+        marker = ET.Comment(_marker_text(meta_hash))
+        properties.addnext(marker)
+        marker.tail, properties.tail = properties.tail, None
+        return
+    markers[0].text = _marker_text(meta_hash)
+    for extra in markers[1:]:
+        # Keep the indentation that followed the extra marker
+        previous = extra.getprevious()
+        previous.tail = (previous.tail or "") + (extra.tail or "")
+        root.remove(extra)
+
+
+class _DiscardTarget:
+    """Parser target that ignores all events; used for well-formedness."""
+
+    def close(self) -> None:
+        return None
+
+
+class _RootPropertiesTarget(_DiscardTarget):
+    """Parser target that notes whether the root has a <properties> child."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.found = False
+
+    def start(self, tag, attrib) -> None:
+        if self.depth == 1 and tag == "properties":
+            self.found = True
+        self.depth += 1
+
+    def end(self, tag) -> None:
+        self.depth -= 1
 
 
-def enrich_file(input_path: Path, output_path: Path, metadata: dict) -> bool:
-    """Enrich a single JUnit XML file with metadata."""
+def splice_properties(
+    input_path: str, output_path: Path, properties_xml: bytes, meta_hash: str
+) -> bool:
+    """Copy input to output, inserting properties_xml as the root's first child.
+
+    The rest of the document is streamed through unchanged, in chunks,
+    while a no-op target parser checks that it is well-formed. An input
+    already enriched with the same metadata is copied verbatim instead.
+
+    Returns False, leaving no output behind, when the file cannot be
+    spliced (root tag not found in the first bytes or in a default
+    namespace, a different <properties> child already present, a
+    <properties> child of the root further down, or output_path is the
+    input itself); the caller then falls back to a full parse.
+    """
+    in_place = output_path.exists() and os.path.samefile(input_path, output_path)
+
+    with open(input_path, "rb") as src:
+        head = src.read(_HEAD_SIZE)
+        root_match = _ROOT_START_TAG.match(head)
+        if root_match is None or _DEFAULT_NAMESPACE.search(root_match.group("tag")):
+            return False
+
+        existing = _EXISTING_PROPERTIES.match(head, root_match.end())
+        if existing.group("properties"):
+            # Our <property> run closing the block means a previous run with
+            # the same metadata, whether it was spliced or appended by lxml
+            if properties_xml.removeprefix(b"<properties>") not in head:
+                return False
+            # Already enriched: copy as is (sendfile where available)
+            if not in_place:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(input_path, output_path)
+            return True
+
+        if in_place or existing.end() == len(head) == _HEAD_SIZE:
+            return False
+
+        # Insert before the first child, reusing its indentation
+        insert_at = existing.end("indent")
+        indent = existing.group("indent")
+
+        # A later <properties> may be the root's own rather than a
+        # testcase's; only then track element depth while checking
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            nested = mm.find(_PROPERTIES_TAG, insert_at) != -1
+        watch = _RootPropertiesTarget() if nested else None
+
+        # A fresh feed parser per file: a failed write must not leave a
+        # half-fed document behind for the next one
+        checker = ET.XMLParser(
+            target=watch or _DiscardTarget(),
+            huge_tree=True,
+            resolve_entities=False,
+            no_network=True,
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(output_path, "wb") as dst:
+                if root_match.group("decl") is None and root_match.group("bom") is None:
+                    dst.write(_XML_DECLARATION)
+                dst.write(head[:insert_at])
+                dst.write(properties_xml)
+                dst.write(f"<!--{_marker_text(meta_hash)}-->".encode())
+                dst.write(indent)
+                dst.write(head[insert_at:])
+
+                # Only original bytes are checked, so error positions match the input
+                checker.feed(head)
+                while not (watch and watch.found) and (
+                    chunk := src.read(_COPY_CHUNK_SIZE)
+                ):
+                    dst.write(chunk)
+                    checker.feed(chunk)
+
+            # Root properties further down: leave it to the full parse,
+            # which extends them as before
+            if watch and watch.found:
+                output_path.unlink()
+                return False
+            checker.close()
+        except ET.XMLSyntaxError as e:
+            # The feed parser only knows "<string>"; name the fixture instead
+            output_path.unlink(missing_ok=True)
+            raise ET.XMLSyntaxError(e.msg, e.code, *e.position, input_path) from None
+        except BaseException:
+            output_path.unlink(missing_ok=True)
+            raise
+
+    return True
+
+
+def enrich_file(
+    input_path: str,
+    output_path: Path,
+    properties_xml: bytes,
+    meta_hash: str,
+    dry_run: bool = False,
+) -> tuple[bool, str]:
+    """Enrich a single JUnit XML file with metadata.
+
+    Output that is already up to date for meta_hash is left alone.
+    Otherwise uses splice_properties() where possible and falls back to
+    parsing the whole tree with lxml. Runs in a worker process, so the
+    outcome is returned as a (success, message) pair for the parent to
+    report.
+    """
     try:
-        tree = ET.parse(input_path)
+        if is_up_to_date(input_path, output_path, meta_hash):
+            return True, f"Up to date: {input_path} -> {output_path}"
+        if dry_run:
+            return True, f"Would enrich: {input_path} -> {output_path}"
+
+        if splice_properties(input_path, output_path, properties_xml, meta_hash):
+            return True, f"Enriched: {input_path} -> {output_path}"
+
+        tree = ET.parse(input_path, parser=_PARSER)
         root = tree.getroot()
 
         # Handle both testsuite and testsuites root elements
         if root.tag == "testsuites":
-            add_metadata_properties(root, metadata)
+            add_metadata_properties(root, properties_xml, meta_hash)
         elif root.tag == "testsuite":
-            add_metadata_properties(root, metadata)
+            add_metadata_properties(root, properties_xml, meta_hash)
         else:
-            print(f"Warning: Unknown root element '{root.tag}' in {input_path}")
-            return False
+            return False, f"Warning: Unknown root element '{root.tag}' in {input_path}"
 
         # Ensure output directory exists
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
         # Write with XML declaration
         tree.write(
-            output_path,
+            str(output_path),
             encoding="UTF-8",
             xml_declaration=True,
         )
 
-        print(f"Enriched: {input_path} -> {output_path}")
-        return True
+        return True, f"Enriched: {input_path} -> {output_path}"
 
-    except ET.ParseError as e:
-        print(f"Error parsing {input_path}: {e}")
-        return False
+    except ET.XMLSyntaxError as e:
+        return False, f"Error parsing {input_path}: {e}"
     except Exception as e:
-        print(f"Error processing {input_path}: {e}")
-        return False
+        return False, f"Error processing {input_path}: {e}"
 
 
 def main():
@@ -105,8 +370,25 @@ def main():
         type=Path,
         help="JSON file with custom metadata values",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would be enriched without writing anything",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only report errors and the summary, not every file",
+    )
 
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Load metadata
     metadata = DEFAULT_METADATA.copy()
@@ -115,18 +397,51 @@ def main():
             custom_metadata = json.load(f)
             metadata.update(custom_metadata)
 
-    # Process all XML files
+    # Fingerprint the metadata before stamping it, so that an automatic
+    # timestamp alone does not make earlier output look stale
+    meta_hash = metadata_fingerprint(metadata)
+    if metadata["jux.timestamp"] is None:
+        metadata["jux.timestamp"] = (
+            datetime.now(timezone.utc)
+            .isoformat(timespec="seconds")
+            .replace("+00:00", "Z")
+        )
+
+    properties_xml = serialize_properties(metadata)
+
+    # Collect files to process
+    raw_root = str(args.raw_dir)
+    prefix_len = len(os.path.join(raw_root, ""))
+    input_paths = list(iter_xml(raw_root))
+    output_paths = [args.enriched_dir / path[prefix_len:] for path in input_paths]
+
+    # Process all XML files in parallel
     success_count = 0
     error_count = 0
 
-    for xml_file in args.raw_dir.rglob("*.xml"):
-        relative_path = xml_file.relative_to(args.raw_dir)
-        output_path = args.enriched_dir / relative_path
-
-        if enrich_file(xml_file, output_path, metadata):
-            success_count += 1
-        else:
-            error_count += 1
+    with ProcessPoolExecutor(max_workers=args.jobs or os.cpu_count()) as executor:
+        results = executor.map(
+            enrich_file,
+            input_paths,
+            output_paths,
+            repeat(properties_xml),
+            repeat(meta_hash),
+            repeat(args.dry_run),
+            chunksize=16,
+        )
+        report = []
+        for ok, message in results:
+            if ok:
+                success_count += 1
+            else:
+                error_count += 1
+            if not (ok and args.quiet):
+                report.append(message)
+            if len(report) >= _OUTPUT_BATCH_SIZE:
+                print("\n".join(report))
+                report.clear()
+        if report:
+            print("\n".join(report))
 
     print(f"\nProcessed {success_count + error_count} files:")
     print(f"  Success: {success_count}")
@@ -9,6 +9,7 @@ to enriched JUnit XML fixtures for tamper-proof verification testing.
 
 Usage:
     python sign-fixtures.py <enriched_dir> <signed_dir> --key <private_key.pem>
+                            [--no-cache] [--quiet]
 
 Example:
     python sign-fixtures.py enriched/ signed/ --key test-key.pem
@@ -25,7 +26,13 @@ Generating a test key:
 """
 
 import argparse
+import hashlib
+import mmap
+import os
+import shutil
 import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -40,38 +47,137 @@ except ImportError as e:
     print("  uv pip install py-juxlib")
     sys.exit(1)
 
+# Content-addressed store of signed outputs, kept below the signed directory
+CACHE_DIR_NAME = ".sign-cache"
+
+# Bump whenever the signed output format changes, to invalidate the cache
+_CACHE_FORMAT = b"4"
+
+# One parser per process, reused for every file; no entity expansion or
+# network access while parsing fixtures
+_PARSER = etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+
+# Files at least this large are parsed from a memory map. Only lxml 6
+# and later parse from buffer objects; older releases always read the
+# file through etree.parse()
+_MMAP_THRESHOLD = 1024 * 1024
+_PARSE_FROM_MMAP = etree.LXML_VERSION >= (6,)
+
+# Per-file report lines are written in batches of this many
+_OUTPUT_BATCH_SIZE = 256
+
+# Per-worker state, set by _init_worker(); signing uses the parsed key directly
+_PRIVATE_KEY = None
+_CACHE_DIR = None
+_KEY_FINGERPRINT = b""
+
+
+def iter_xml(root: str) -> Iterator[str]:
+    """Yield the path of every *.xml file below root, skipping hidden directories."""
+    pending = [root]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        pending.append(entry.path)
+                elif entry.name.endswith(".xml") and entry.is_file():
+                    yield entry.path
+
+
+def parse_xml(path: str, parser: etree.XMLParser):
+    """Parse an XML file the way etree.parse() does.
+
+    With lxml 6 or later, files of _MMAP_THRESHOLD bytes or more are
+    memory-mapped and parsed from the mapping, which saves libxml2
+    copying them through its read buffer. Returns the ElementTree, or the target's close() result for
+    target parsers.
+    """
+    if not _PARSE_FROM_MMAP or os.path.getsize(path) < _MMAP_THRESHOLD:
+        return etree.parse(path, parser=parser)
+
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = etree.fromstring(mm, parser=parser, base_url=path)
+    return result.getroottree() if isinstance(result, etree._Element) else result
+
+
+def _init_worker(key_pem: bytes, cache_dir: Path | None) -> None:
+    """Load the private key and cache settings once per worker process."""
+    global _PRIVATE_KEY, _CACHE_DIR, _KEY_FINGERPRINT
+    _PRIVATE_KEY = load_private_key(key_pem)
+    _CACHE_DIR = cache_dir
+    _KEY_FINGERPRINT = hashlib.sha256(_CACHE_FORMAT + key_pem).digest()
+
+
+def _sign_worker(job: tuple[str, Path]) -> tuple[bool, str]:
+    """Sign one (input_path, output_path) job with the worker's key.
+
+    With a cache directory configured, inputs whose content was already
+    signed with the same key are copied from the cache instead.
+    """
+    input_path, output_path = job
+    if _CACHE_DIR is None:
+        return sign_file(input_path, output_path, _PRIVATE_KEY)
 
-def sign_file(input_path: Path, output_path: Path, private_key) -> bool:
-    """Sign a single JUnit XML file."""
+    try:
+        digest = hashlib.sha256(_KEY_FINGERPRINT + Path(input_path).read_bytes())
+        cached_path = _CACHE_DIR / f"{digest.hexdigest()}.xml"
+        if cached_path.exists():
+            # Always copy: an output edited since (e.g. for tamper tests)
+            # must not survive a rerun
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(cached_path, output_path)
+            return True, f"Cached: {input_path} -> {output_path}"
+    except OSError as e:
+        return False, f"Error reading {input_path}: {e}"
+
+    ok, message = sign_file(input_path, output_path, _PRIVATE_KEY)
+    if ok:
+        # Store a separate copy, never a hard link, so that editing the
+        # output cannot change the cache entry; os.replace keeps a
+        # concurrent reader from seeing a partial entry
+        temp_path = cached_path.with_name(f"{cached_path.name}.{os.getpid()}.tmp")
+        try:
+            shutil.copyfile(output_path, temp_path)
+            os.replace(temp_path, cached_path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+    return ok, message
+
+
+def sign_file(input_path: str, output_path: Path, private_key) -> tuple[bool, str]:
+    """Sign a single JUnit XML file.
+
+    Returns a (success, message) pair for the caller to report.
+    """
     try:
         # Parse XML
-        tree = etree.parse(str(input_path))
+        tree = parse_xml(input_path, _PARSER)
         root = tree.getroot()
 
-        # Sign the XML
+        # Sign the XML through py-juxlib, so fixtures carry exactly the
+        # signatures its clients produce (no lower-level API to reuse)
         signed_root = sign_xml(root, private_key)
 
         # Ensure output directory exists
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Write signed XML
+        # Write signed XML in canonical form (UTF-8, no XML declaration),
+        # so verifiers can digest it without renormalizing
         signed_tree = etree.ElementTree(signed_root)
-        signed_tree.write(
-            str(output_path),
-            encoding="UTF-8",
-            xml_declaration=True,
-            pretty_print=True,
-        )
+        signed_tree.write(str(output_path), method="c14n", with_comments=False)
 
-        print(f"Signed: {input_path} -> {output_path}")
-        return True
+        return True, f"Signed: {input_path} -> {output_path}"
 
     except etree.XMLSyntaxError as e:
-        print(f"Error parsing {input_path}: {e}")
-        return False
+        return False, f"Error parsing {input_path}: {e}"
     except Exception as e:
-        print(f"Error signing {input_path}: {e}")
-        return False
+        return False, f"Error signing {input_path}: {e}"
 
 
 def main():
@@ -95,12 +201,25 @@ def main():
         type=Path,
         help="Optional X.509 certificate to include in signature",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Re-sign every file instead of reusing <signed_dir>/{CACHE_DIR_NAME}",
+    )
+
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only report errors and the summary, not every file",
+    )
 
     args = parser.parse_args()
 
-    # Load private key
+    # Read the private key once; the parent only checks that it parses,
+    # and each worker keeps its own parsed copy for all of its files
     try:
-        private_key = load_private_key(args.key)
+        key_pem = args.key.read_bytes()
+        load_private_key(key_pem)
         print(f"Loaded private key from {args.key}")
     except Exception as e:
         print(f"Error loading private key: {e}")
@@ -112,18 +231,41 @@ def main():
         cert = args.cert.read_text()
         print(f"Loaded certificate from {args.cert}")
 
-    # Process all XML files
+    # Set up the signing cache
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.signed_dir / CACHE_DIR_NAME
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Collect files to process
+    enriched_root = str(args.enriched_dir)
+    prefix_len = len(os.path.join(enriched_root, ""))
+    jobs = [
+        (path, args.signed_dir / path[prefix_len:]) for path in iter_xml(enriched_root)
+    ]
+
+    # Process all XML files in parallel, each worker holding its own key
     success_count = 0
     error_count = 0
 
-    for xml_file in args.enriched_dir.rglob("*.xml"):
-        relative_path = xml_file.relative_to(args.enriched_dir)
-        output_path = args.signed_dir / relative_path
-
-        if sign_file(xml_file, output_path, private_key):
-            success_count += 1
-        else:
-            error_count += 1
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(key_pem, cache_dir),
+    ) as executor:
+        report = []
+        for ok, message in executor.map(_sign_worker, jobs, chunksize=16):
+            if ok:
+                success_count += 1
+            else:
+                error_count += 1
+            if not (ok and args.quiet):
+                report.append(message)
+            if len(report) >= _OUTPUT_BATCH_SIZE:
+                print("\n".join(report))
+                report.clear()
+        if report:
+            print("\n".join(report))
 
     print(f"\nProcessed {success_count + error_count} files:")
     print(f"  Success: {success_count}")
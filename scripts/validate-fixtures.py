@@ -8,7 +8,7 @@ This script validates XML fixtures to ensure they conform to
 JUnit XML schema specifications.
 
 Usage:
-    python validate-fixtures.py <fixtures_dir> [--schema <schema.xsd>]
+    python validate-fixtures.py <fixtures_dir> [--schema <schema.xsd>] [--quiet]
 
 Example:
     python validate-fixtures.py raw/
@@ -19,7 +19,11 @@ Prerequisites:
 """
 
 import argparse
+import mmap
+import os
 import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -30,25 +34,115 @@ except ImportError:
     sys.exit(1)
 
 
-def validate_well_formed(xml_path: Path) -> tuple[bool, str | None]:
+class _DiscardTarget:
+    """Parser target that ignores all events, so no elements are built."""
+
+    def close(self) -> None:
+        return None
+
+
+# Parsers are created once per process and reused for every file; neither
+# expands entities nor touches the network
+_PARSER = etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+
+# Well-formedness only needs libxml2's parse events, not a tree
+_WELL_FORMED_PARSER = etree.XMLParser(
+    target=_DiscardTarget(), huge_tree=True, resolve_entities=False, no_network=True
+)
+
+# Files at least this large are parsed from a memory map. Only lxml 6
+# and later parse from buffer objects; older releases always read the
+# file through etree.parse()
+_MMAP_THRESHOLD = 1024 * 1024
+_PARSE_FROM_MMAP = etree.LXML_VERSION >= (6,)
+
+# Per-file report lines are written in batches of this many
+_OUTPUT_BATCH_SIZE = 256
+
+# Compiled schema of the current worker process, set by _init_worker()
+_SCHEMA = None
+
+
+def _init_worker(schema_path: Path | None) -> None:
+    """Compile the XSD schema once per worker process."""
+    global _SCHEMA
+    if schema_path is not None:
+        _SCHEMA = etree.XMLSchema(etree.parse(str(schema_path)))
+
+
+def iter_xml(root: str) -> Iterator[str]:
+    """Yield the path of every *.xml file below root, skipping hidden directories."""
+    pending = [root]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        pending.append(entry.path)
+                elif entry.name.endswith(".xml") and entry.is_file():
+                    yield entry.path
+
+
+def parse_xml(path: str, parser: etree.XMLParser):
+    """Parse path like etree.parse(), reading it from an mmap when it is large."""
+    if not _PARSE_FROM_MMAP or os.path.getsize(path) < _MMAP_THRESHOLD:
+        return etree.parse(path, parser=parser)
+
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = etree.fromstring(mm, parser=parser, base_url=path)
+    return result.getroottree() if isinstance(result, etree._Element) else result
+
+
+def validate_well_formed(xml_path: str) -> tuple[bool, str | None]:
     """Check if XML is well-formed."""
     try:
-        etree.parse(str(xml_path))
+        parse_xml(xml_path, _WELL_FORMED_PARSER)
         return True, None
     except etree.XMLSyntaxError as e:
         return False, str(e)
 
 
-def validate_against_schema(xml_path: Path, schema: etree.XMLSchema) -> tuple[bool, str | None]:
-    """Validate XML against an XSD schema."""
+def validate_against_schema(
+    xml_path: str, schema: etree.XMLSchema
+) -> tuple[bool, str | None]:
+    """Validate XML against an XSD schema.
+
+    The file is parsed once; the same tree is then checked with
+    schema.validate(), so both well-formedness and schema errors come
+    from a single parse. The error message says which one failed.
+    """
     try:
-        doc = etree.parse(str(xml_path))
-        schema.assertValid(doc)
-        return True, None
-    except etree.DocumentInvalid as e:
-        return False, str(e)
+        doc = parse_xml(xml_path, _PARSER)
     except etree.XMLSyntaxError as e:
-        return False, f"XML syntax error: {e}"
+        return False, f"Not well-formed: {e}"
+
+    if schema.validate(doc):
+        return True, None
+    return False, "Schema validation failed: " + "; ".join(
+        f"{entry.message}, line {entry.line}" for entry in schema.error_log
+    )
+
+
+def validate_file(xml_path: str) -> tuple[bool, str | None]:
+    """Validate one file with the worker's schema, or check well-formedness."""
+    # A file that cannot be read is reported like any other failure rather
+    # than aborting the whole run from inside the worker
+    try:
+        if _SCHEMA is not None:
+            return validate_against_schema(xml_path, _SCHEMA)
+
+        is_well_formed, error = validate_well_formed(xml_path)
+    except (OSError, ValueError) as e:
+        return False, f"Could not read: {e}"
+    if not is_well_formed:
+        return False, f"Not well-formed: {error}"
+
+    return True, None
 
 
 def main():
@@ -69,54 +163,64 @@ def main():
         help="Include malformed fixtures in validation (expect failures)",
     )
 
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only print the summary and errors, not a line per file",
+    )
+
     args = parser.parse_args()
 
-    # Load schema if provided
-    schema = None
+    # Load schema if provided; workers compile their own copy
     if args.schema:
         try:
             schema_doc = etree.parse(str(args.schema))
-            schema = etree.XMLSchema(schema_doc)
+            etree.XMLSchema(schema_doc)
             print(f"Loaded schema: {args.schema}")
         except Exception as e:
             print(f"Error loading schema: {e}")
             return 1
 
     # Collect files to validate
-    xml_files = list(args.fixtures_dir.rglob("*.xml"))
+    fixtures_root = str(args.fixtures_dir)
+    prefix_len = len(os.path.join(fixtures_root, ""))
+    xml_files = list(iter_xml(fixtures_root))
 
     # Optionally exclude malformed directory
     if not args.include_malformed:
-        xml_files = [f for f in xml_files if "malformed" not in str(f)]
+        xml_files = [path for path in xml_files if "malformed" not in path]
 
     print(f"Found {len(xml_files)} XML files to validate\n")
 
-    # Validate files
+    # Validate files in parallel
     valid_count = 0
     invalid_count = 0
     errors = []
 
-    for xml_file in sorted(xml_files):
-        # First check well-formedness
-        is_well_formed, error = validate_well_formed(xml_file)
-
-        if not is_well_formed:
-            invalid_count += 1
-            errors.append((xml_file, f"Not well-formed: {error}"))
-            print(f"INVALID: {xml_file.relative_to(args.fixtures_dir)}")
-            continue
-
-        # Then validate against schema if provided
-        if schema:
-            is_valid, error = validate_against_schema(xml_file, schema)
-            if not is_valid:
+    # Sort plain strings: C-level comparison, no PurePath.__lt__ per pair
+    xml_files.sort()
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(), initializer=_init_worker, initargs=(args.schema,)
+    ) as executor:
+        results = executor.map(validate_file, xml_files, chunksize=16)
+        report = []
+        for xml_file, (is_valid, error) in zip(xml_files, results):
+            relative_path = xml_file[prefix_len:]
+            if is_valid:
+                valid_count += 1
+                status = "VALID:  "
+            else:
                 invalid_count += 1
-                errors.append((xml_file, f"Schema validation failed: {error}"))
-                print(f"INVALID: {xml_file.relative_to(args.fixtures_dir)}")
-                continue
+                errors.append((relative_path, error))
+                status = "INVALID:"
 
-        valid_count += 1
-        print(f"VALID:   {xml_file.relative_to(args.fixtures_dir)}")
+            if not args.quiet:
+                report.append(f"{status} {relative_path}")
+            if len(report) >= _OUTPUT_BATCH_SIZE:
+                print("\n".join(report))
+                report.clear()
+        if report:
+            print("\n".join(report))
 
     # Summary
     print(f"\n{'='*60}")
@@ -127,8 +231,8 @@ def main():
 
     if errors:
         print(f"\nErrors:")
-        for file_path, error in errors:
-            print(f"  {file_path.relative_to(args.fixtures_dir)}:")
+        for relative_path, error in errors:
+            print(f"  {relative_path}:")
             print(f"    {error[:200]}...")
 
     return 0 if invalid_count == 0 else 1